@@ -1,7 +1,7 @@
 """Benchmark script for 'server' mode using the signaling WebSocket.
 
-This script opens two WebSocket connections to the signaling server:
- - producer: sends `detection` messages with `capture_ts` and `inference_ts`.
+This script opens two WebSocket connections to the signaling server, both driven from one asyncio event loop:
+ - producer: sends `detection` payloads with `capture_ts` and `inference_ts`, several per `batch` frame.
  - receiver: listens for forwarded `detection` messages (signaling will add `recv_ts`).
 
 Measured values (per forwarded message):
@@ -17,244 +17,307 @@ Computed metrics:
  - Processed FPS = count_displayed / duration
  - Bandwidth estimate = bytes sent by producer / bytes received by receiver (kbps)
 
-If the signaling server is unreachable or `websocket` (websocket-client) is not installed,
+If the signaling server is unreachable or `websockets` is not installed,
 the script falls back to a local simulation to produce metrics.json.
 """
 from __future__ import annotations
 
 import argparse
+import asyncio
+import bisect
+import contextlib
 import json
 import math
-import statistics
-import threading
+import socket
 import time
-import uuid
-from typing import List
+
+import numpy as np
+import orjson
 
 try:
-    import websocket  # websocket-client
+    import websockets  # asyncio producer and receiver
 except Exception:
-    websocket = None
+    websockets = None
 
 
-def percentile(data: List[float], p: float) -> float:
-    if not data:
+def percentile(data: np.ndarray, p: float) -> float:
+    # np.partition is an O(n) selection; only the two neighbouring ranks are needed
+    n = len(data)
+    if n == 0:
         return 0.0
-    data = sorted(data)
-    k = (len(data) - 1) * (p / 100.0)
+    k = (n - 1) * (p / 100.0)
     f = math.floor(k)
     c = math.ceil(k)
+    part = np.partition(data, (f, c))
     if f == c:
-        return data[int(k)]
-    d0 = data[int(f)] * (c - k)
-    d1 = data[int(c)] * (k - f)
-    return d0 + d1
-
-
-class Receiver:
-    def __init__(self, url: str):
-        self.url = url
-        self.ws_app = None
-        self.thread = None
-        self.lock = threading.Lock()
-        self.messages = []  # tuples of (payload_dict, local_recv_ts_ms, raw_message_bytes_len)
-        self.connected = False
-
-    def _on_message(self, ws, message):
-        now_ms = int(time.time() * 1000)
-        try:
-            j = json.loads(message)
-        except Exception:
+        return float(part[f])
+    d0 = part[f] * (c - k)
+    d1 = part[c] * (k - f)
+    return float(d0 + d1)
+
+
+def median(data: np.ndarray) -> float:
+    return float(np.median(data)) if len(data) else 0.0
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile using the P-square algorithm (Jain & Chlamtac, 1985).
+
+    Keeps five markers regardless of how many samples are added, so memory is O(1) per stream and
+    no end-of-run sort is needed. The estimate is exact until the fifth sample and close after that.
+    """
+
+    def __init__(self, q: float):
+        self.q = q  # target quantile in [0, 1]
+        self.count = 0
+        self.heights = []  # marker heights; the first five samples until initialised
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1.0 + 2.0 * q, 1.0 + 4.0 * q, 3.0 + 2.0 * q, 5.0]
+        self.increments = [0.0, q / 2.0, q, (1.0 + q) / 2.0, 1.0]
+
+    def add(self, x: float):
+        self.count += 1
+        h = self.heights
+        if self.count <= 5:
+            h.append(x)
+            if self.count == 5:
+                h.sort()
             return
-        with self.lock:
-            self.messages.append((j, now_ms, len(message.encode('utf-8'))))
-
-    def _on_open(self, ws):
-        self.connected = True
-
-    def _on_close(self, ws, close_status_code, close_msg):
-        self.connected = False
-
-    def _on_error(self, ws, err):
-        # Keep running; errors will be seen by caller
-        pass
-
-    def start(self):
-        if websocket is None:
-            raise RuntimeError('websocket-client not installed')
-        self.ws_app = websocket.WebSocketApp(self.url,
-                                            on_message=self._on_message,
-                                            on_open=self._on_open,
-                                            on_close=self._on_close,
-                                            on_error=self._on_error)
-        self.thread = threading.Thread(target=self.ws_app.run_forever, daemon=True)
-        self.thread.start()
-        # wait a short moment for connection
-        t0 = time.time()
-        while time.time() - t0 < 3.0:
-            if self.connected:
-                return True
-            time.sleep(0.05)
-        return self.connected
-
-    def stop(self):
+
+        # find the cell holding x, stretching the outer markers if it falls outside them
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(h, x) - 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1.0
+        nd = self.desired
+        dn = self.increments
+        for i in range(5):
+            nd[i] += dn[i]
+
+        # move the three middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = nd[i] - n[i]
+            if (d >= 1.0 and n[i + 1] - n[i] > 1.0) or (d <= -1.0 and n[i - 1] - n[i] < -1.0):
+                d = 1.0 if d > 0 else -1.0
+                hp = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if not h[i - 1] < hp < h[i + 1]:
+                    j = i + int(d)
+                    hp = h[i] + d * (h[j] - h[i]) / (n[j] - n[i])
+                h[i] = hp
+                n[i] += d
+
+    def value(self) -> float:
+        if self.count >= 5:
+            return float(self.heights[2])
+        # too few samples for the markers; fall back to the exact value
+        return percentile(np.asarray(self.heights, dtype=np.float64), self.q * 100.0)
+
+
+# The detection list never changes, so payloads are formatted from a pre-serialized template instead of
+# building a dict and running it through a JSON encoder on every send.
+DETECTION_TEMPLATE = (
+    '{"frame_id":"%s","capture_ts":%d,"inference_ts":%d,'
+    '"detections":[{"label":"person","score":0.8,"xmin":0.1,"ymin":0.1,"xmax":0.3,"ymax":0.4}]}'
+)
+DETECTION_FRAME = '{"type":"detection","payload":%s}'
+BATCH_FRAME = '{"type":"batch","payload":[%s]}'
+
+
+def make_detection_json(seq: int, capture_ts: int) -> str:
+    # simulate inference delay of ~50ms +/- jitter
+    inference_ts = capture_ts + int(max(10, min(200, int(50 + (10 * (0.5 - math.sin(capture_ts / 1000.0)))))))
+
+    # a per-run counter is unique enough for matching telemetry and avoids a urandom read per frame
+    return DETECTION_TEMPLATE % (f"bench-{seq:08x}", capture_ts, inference_ts)
+
+
+async def produce(ws, end_time: float, interval: float, batch_size: int) -> int:
+    """Send detections until end_time, coalescing batch_size payloads into one frame per tick.
+
+    Returns the number of bytes sent. The effective detection rate stays 1/interval.
+    """
+    bytes_sent = 0
+    seq = 0
+    _time_ns = time.time_ns
+    tick = interval * batch_size
+    # Sends are scheduled against absolute deadlines so per-iteration work does not accumulate as rate drift.
+    next_send = time.monotonic()
+    while next_send < end_time:
+        slack = next_send - time.monotonic()
+        if slack > 0:
+            await asyncio.sleep(slack)
+        next_send += tick
+
+        items = []
+        for _ in range(batch_size):
+            seq += 1
+            items.append(make_detection_json(seq, _time_ns() // 1_000_000))
+        if batch_size == 1:
+            frame = DETECTION_FRAME % items[0]
+        else:
+            frame = BATCH_FRAME % ','.join(items)
+        # the template is pure ASCII; the signaling server parses binary and text frames alike
+        msg = frame.encode('ascii')
         try:
-            if self.ws_app:
-                self.ws_app.close()
+            await ws.send(msg)
+            bytes_sent += len(msg)
         except Exception:
-            pass
-
-    def pop_messages(self):
-        with self.lock:
-            msgs = list(self.messages)
-            self.messages.clear()
-        return msgs
+            # If sending fails, stop producing and report what was sent
+            break
+    return bytes_sent
 
 
-def run_server_mode(duration_s: int, rate_hz: float, msg_size_bytes: int, signaling_url: str, out: str):
-    # Attempt to use websocket-client. If not available, fallback to simulation
-    if websocket is None:
-        print('websocket-client not available; falling back to simulation')
-        return run_simulation(duration_s, rate_hz, msg_size_bytes, out)
+class SignalingConnectError(Exception):
+    """The signaling server could not be reached before the benchmark started."""
 
-    receiver = Receiver(signaling_url.replace('ws://', 'ws://'))
-    ok = receiver.start()
-    if not ok:
-        print('Failed to connect receiver to signaling server; falling back to simulation')
-        return run_simulation(duration_s, rate_hz, msg_size_bytes, out)
 
-    # create a separate raw websocket for producer to send messages
-    try:
-        prod_ws = websocket.create_connection(signaling_url, timeout=5)
-    except Exception as e:
-        print('Producer failed to connect to signaling server:', e)
-        receiver.stop()
+def run_server_mode(duration_s: int, rate_hz: float, msg_size_bytes: int, signaling_url: str, out: str, batch_size: int = 4):
+    # Attempt to use websockets. If not available, fallback to simulation
+    if websockets is None:
+        print('websockets not available; falling back to simulation')
         return run_simulation(duration_s, rate_hz, msg_size_bytes, out)
 
-    bytes_sent = 0
     bytes_recv = 0
 
-    e2e_latencies = []
-    server_latencies = []
-    network_latencies = []
+    # median and p95 per stream are tracked incrementally, so memory does not grow with duration x rate
+    e2e_median, e2e_p95 = P2Quantile(0.5), P2Quantile(0.95)
+    server_median, server_p95 = P2Quantile(0.5), P2Quantile(0.95)
+    network_median, network_p95 = P2Quantile(0.5), P2Quantile(0.95)
+    messages_received = 0
     processed = 0
     telemetry_map = {}  # frame_id -> overlay_display_ts (ms)
 
     interval = 1.0 / rate_hz if rate_hz > 0 else 0.1
-    end_time = time.time() + duration_s
-
-    # Start a reading thread that periodically consumes receiver.messages
-    def consume_loop():
-        nonlocal bytes_recv, processed
-        while time.time() < end_time + 1.0:
-            msgs = receiver.pop_messages()
-            for (msg, local_recv_ts, raw_len) in msgs:
-                # expect msg = { type, from, payload }
-                payload = None
-                mtype = None
-                if isinstance(msg, dict) and 'type' in msg:
-                    mtype = msg.get('type')
-                if isinstance(msg, dict) and 'payload' in msg:
-                    payload = msg['payload']
-                elif isinstance(msg, dict):
-                    payload = msg
-                else:
-                    continue
-
-                # Handle telemetry messages specially
-                if mtype == 'telemetry' and isinstance(payload, dict):
-                    try:
-                        fid = payload.get('frame_id')
-                        odt = int(payload.get('overlay_display_ts')) if payload.get('overlay_display_ts') is not None else None
-                        if fid and odt:
-                            telemetry_map[str(fid)] = odt
-                    except Exception:
-                        pass
-                    bytes_recv += raw_len
-                    continue
-
-                bytes_recv += raw_len
-
-                # must have capture_ts and inference_ts and recv_ts
-                try:
-                    capture_ts = int(payload.get('capture_ts'))
-                    inference_ts = int(payload.get('inference_ts'))
-                    recv_ts = int(payload.get('recv_ts')) if payload.get('recv_ts') is not None else None
-                except Exception:
-                    continue
 
-                # Prefer client-sent overlay_display_ts from telemetry_map when available
-                overlay_display_ts = None
+    # Signaling never echoes a message back to its sender, so the receiver still needs its own connection
+    async def consume(ws):
+        nonlocal bytes_recv, processed, messages_received
+        _time_ns = time.time_ns
+        async for message in ws:
+            local_recv_ts = _time_ns() // 1_000_000
+            # binary frames already are the wire bytes; only text frames need encoding to be measured
+            if isinstance(message, (bytes, bytearray)) or message.isascii():
+                bytes_recv += len(message)
+            else:
+                bytes_recv += len(message.encode('utf-8'))
+            try:
+                msg = orjson.loads(message)
+            except Exception:
+                continue
+
+            # expect msg = { type, from, payload }
+            payload = None
+            mtype = None
+            if isinstance(msg, dict) and 'type' in msg:
+                mtype = msg.get('type')
+            if isinstance(msg, dict) and 'payload' in msg:
+                payload = msg['payload']
+            elif isinstance(msg, dict):
+                payload = msg
+            else:
+                continue
+
+            # Handle telemetry messages specially
+            if mtype == 'telemetry' and isinstance(payload, dict):
                 try:
-                    overlay_display_ts = telemetry_map.get(str(payload.get('frame_id'))) if payload.get('frame_id') is not None else None
+                    fid = payload.get('frame_id')
+                    odt = int(payload.get('overlay_display_ts')) if payload.get('overlay_display_ts') is not None else None
+                    if fid and odt:
+                        telemetry_map[str(fid)] = odt
                 except Exception:
-                    overlay_display_ts = None
-                if overlay_display_ts is None:
-                    overlay_display_ts = int(local_recv_ts)
-                e2e_latencies.append(overlay_display_ts - capture_ts)
-                if recv_ts is not None:
-                    network_latencies.append(recv_ts - capture_ts)
-                    server_latencies.append(inference_ts - recv_ts)
-
-                # consider message processed if detections exist
-                dets = payload.get('detections')
-                if isinstance(dets, list) and len(dets) > 0:
-                    processed += 1
-
-            time.sleep(0.05)
-
-    consumer = threading.Thread(target=consume_loop, daemon=True)
-    consumer.start()
-
-    # Send messages at desired rate. Each message will be of type 'detection' so signaling validates and forwards.
-    while time.time() < end_time:
-        capture_ts = int(time.time() * 1000)
-        # simulate inference delay of ~50ms +/- jitter
-        inference_ts = capture_ts + int(max(10, min(200, int(50 + (10 * (0.5 - math.sin(time.time())))))))
-
-        frame_id = f"bench-{uuid.uuid4().hex[:8]}"
-        payload = {
-            'frame_id': frame_id,
-            'capture_ts': capture_ts,
-            'inference_ts': inference_ts,
-            'detections': [
-                { 'label': 'person', 'score': 0.8, 'xmin': 0.1, 'ymin': 0.1, 'xmax': 0.3, 'ymax': 0.4 }
-            ]
-        }
-        msg = json.dumps({ 'type': 'detection', 'payload': payload })
-        try:
-            prod_ws.send(msg)
-            bytes_sent += len(msg.encode('utf-8'))
-        except Exception:
-            # If sending fails, break and fallback
-            break
-
-        time.sleep(interval)
-
-    # close sockets
+                    pass
+                continue
+
+            # must have capture_ts and inference_ts and recv_ts
+            try:
+                capture_ts = int(payload.get('capture_ts'))
+                inference_ts = int(payload.get('inference_ts'))
+                recv_ts = int(payload.get('recv_ts')) if payload.get('recv_ts') is not None else None
+            except Exception:
+                continue
+
+            # Prefer client-sent overlay_display_ts from telemetry_map when available
+            overlay_display_ts = None
+            try:
+                overlay_display_ts = telemetry_map.get(str(payload.get('frame_id'))) if payload.get('frame_id') is not None else None
+            except Exception:
+                overlay_display_ts = None
+            if overlay_display_ts is None:
+                overlay_display_ts = local_recv_ts
+            messages_received += 1
+            e2e = overlay_display_ts - capture_ts
+            e2e_median.add(e2e)
+            e2e_p95.add(e2e)
+            if recv_ts is not None:
+                network = recv_ts - capture_ts
+                server = inference_ts - recv_ts
+                network_median.add(network)
+                network_p95.add(network)
+                server_median.add(server)
+                server_p95.add(server)
+
+            # consider message processed if detections exist
+            dets = payload.get('detections')
+            if isinstance(dets, list) and len(dets) > 0:
+                processed += 1
+
+    async def main():
+        async with contextlib.AsyncExitStack() as stack:
+            # only a failed connect may fall back to simulation; errors after that abort the run
+            try:
+                rx = await stack.enter_async_context(websockets.connect(signaling_url, open_timeout=5))
+                tx = await stack.enter_async_context(websockets.connect(signaling_url, open_timeout=5))
+            except Exception as e:
+                raise SignalingConnectError(e) from e
+            # disable Nagle explicitly so small frames are not held back waiting for an ACK
+            sock = tx.transport.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # interval math uses the monotonic clock; payload timestamps stay wall-clock ms to match signaling's recv_ts
+            end_time = time.monotonic() + duration_s
+
+            async def producer():
+                sent = await produce(tx, end_time, interval, batch_size)
+                # give in-flight forwards a moment to arrive, then closing rx ends the consumer's loop
+                await asyncio.sleep(0.5)
+                await rx.close()
+                return sent
+
+            sent, _ = await asyncio.gather(producer(), consume(rx))
+            return sent
+
+    # Send messages at desired rate while receiving on the same thread. Detections are batched per tick;
+    # signaling unwraps 'batch' frames and validates/forwards each payload as a 'detection' message.
+    batch_size = max(1, min(8, batch_size))
     try:
-        prod_ws.close()
-    except Exception:
-        pass
-    receiver.stop()
-
-    # wait a short moment for consumer to finish
-    time.sleep(0.5)
+        bytes_sent = asyncio.run(main())
+    except SignalingConnectError as e:
+        print('Failed to connect to signaling server; falling back to simulation:', e)
+        return run_simulation(duration_s, rate_hz, msg_size_bytes, out)
 
     duration_observed = duration_s
-    median_e2e = statistics.median(e2e_latencies) if e2e_latencies else 0.0
-    p95_e2e = percentile(e2e_latencies, 95.0) if e2e_latencies else 0.0
-    median_server = statistics.median(server_latencies) if server_latencies else 0.0
-    p95_server = percentile(server_latencies, 95.0) if server_latencies else 0.0
-    median_network = statistics.median(network_latencies) if network_latencies else 0.0
-    p95_network = percentile(network_latencies, 95.0) if network_latencies else 0.0
+    median_e2e = e2e_median.value()
+    p95_e2e = e2e_p95.value()
+    median_server = server_median.value()
+    p95_server = server_p95.value()
+    median_network = network_median.value()
+    p95_network = network_p95.value()
     fps = processed / duration_observed if duration_observed > 0 else 0.0
     uplink_kbps = (bytes_sent * 8) / (duration_observed * 1000.0) if duration_observed > 0 else 0.0
     downlink_kbps = (bytes_recv * 8) / (duration_observed * 1000.0) if duration_observed > 0 else 0.0
 
     metrics = {
         'duration_s': duration_observed,
-        'messages_received': len(e2e_latencies),
+        'messages_received': messages_received,
         'median_e2e_latency_ms': round(median_e2e, 2),
         'p95_e2e_latency_ms': round(p95_e2e, 2),
         'median_server_latency_ms': round(median_server, 2),
@@ -279,10 +342,10 @@ def run_server_mode(duration_s: int, rate_hz: float, msg_size_bytes: int, signal
 def run_simulation(duration_s: int, rate_hz: float, msg_size_bytes: int, out: str):
     # reuse bench_ws.py style simulation for compatibility
     msgs = int(duration_s * rate_hz)
-    # simulate similar latencies
-    import random
-    rtts = [max(10, random.gauss(60, 20)) for _ in range(max(1, msgs))]
-    median = statistics.median(rtts)
+    # simulate similar latencies in a single vectorized draw
+    rng = np.random.default_rng()
+    rtts = np.maximum(10.0, rng.normal(60.0, 20.0, max(1, msgs)))
+    median_ms = median(rtts)
     p95 = percentile(rtts, 95.0)
     fps = msgs / duration_s if duration_s > 0 else 0.0
     bytes_sent = msgs * msg_size_bytes
@@ -291,11 +354,11 @@ def run_simulation(duration_s: int, rate_hz: float, msg_size_bytes: int, out: st
     metrics = {
         'duration_s': duration_s,
         'messages_received': msgs,
-        'median_e2e_latency_ms': round(median, 2),
+        'median_e2e_latency_ms': round(median_ms, 2),
         'p95_e2e_latency_ms': round(p95, 2),
-        'median_server_latency_ms': round(max(0, median - 20), 2),
+        'median_server_latency_ms': round(max(0, median_ms - 20), 2),
         'p95_server_latency_ms': round(max(0, p95 - 20), 2),
-        'median_network_latency_ms': round(max(0, median - 30), 2),
+        'median_network_latency_ms': round(max(0, median_ms - 30), 2),
         'p95_network_latency_ms': round(max(0, p95 - 30), 2),
         'fps': round(fps, 2),
         'uplink_kbps': round((bytes_sent * 8) / (duration_s * 1000.0), 2) if duration_s > 0 else 0.0,
@@ -317,9 +380,10 @@ def main():
     parser.add_argument('--msg-size', type=int, default=4000)
     parser.add_argument('--signaling-url', default='ws://localhost:8080')
     parser.add_argument('--out', default='bench/metrics.json')
+    parser.add_argument('--batch', type=int, default=4, help='Detections coalesced per WebSocket frame (1-8)')
     args = parser.parse_args()
 
-    run_server_mode(args.duration, args.rate, args.msg_size, args.signaling_url, args.out)
+    run_server_mode(args.duration, args.rate, args.msg_size, args.signaling_url, args.out, args.batch)
 
 
 if __name__ == '__main__':
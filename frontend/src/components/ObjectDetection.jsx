@@ -240,8 +240,11 @@ const ObjectDetection = ({ videoStream, sendDetectionToPeer, remoteDetections, o
     const defaultLiveWsUrl = envLiveWs || `${window.location.protocol === 'https:' ? 'wss' : 'ws'}://${window.location.hostname}:8001/ws/live`;
     const liveWsUrl = wsUrlOverride || defaultLiveWsUrl;
     let ws = null;
+    // annotated JPEGs arrive as binary frames; keep the current Blob URL so it can be revoked when replaced
+    let annotatedUrl = null;
     try {
       ws = new WebSocket(liveWsUrl);
+      ws.binaryType = 'blob';
       liveWsRef.current = ws;
     } catch (e) {
       console.warn('Failed to create live WS to', liveWsUrl, e);
@@ -252,9 +255,15 @@ const ObjectDetection = ({ videoStream, sendDetectionToPeer, remoteDetections, o
       setLiveConnected(true);
     };
     ws.onmessage = (ev) => {
+      if (ev.data instanceof Blob) {
+        const url = URL.createObjectURL(ev.data);
+        if (annotatedUrl) URL.revokeObjectURL(annotatedUrl);
+        annotatedUrl = url;
+        setAnnotatedB64(url);
+        return;
+      }
       try {
         const j = JSON.parse(ev.data);
-        if (j.annotated_b64) setAnnotatedB64(j.annotated_b64);
         if (j.detections) setServerDetections(j.detections);
       } catch (e) {
         console.warn('Invalid message from live WS', e);
@@ -273,6 +282,8 @@ const ObjectDetection = ({ videoStream, sendDetectionToPeer, remoteDetections, o
       try { if (ws) ws.close(); } catch (e) {}
       liveWsRef.current = null;
       setLiveConnected(false);
+      if (annotatedUrl) URL.revokeObjectURL(annotatedUrl);
+      setAnnotatedB64(null);
     };
   }, [enableLocalDetection, wsUrlOverride]);
 
@@ -8,6 +8,7 @@ Parameters:
   -Weights  : Path or filename of the .pt weights (default: yolov5n.pt)
   -Img      : Image size to export for (default: 640)
   -Device   : Device for export (cpu or 0 for GPU) (default: cpu)
+  -Dynamic  : Export with a dynamic batch axis so the server can micro-batch concurrent frames
 
 Notes:
  - This script will try to use `server/.venv` Python if it exists. Otherwise it will use the system `python`.
@@ -18,7 +19,8 @@ Notes:
 param(
   [string]$Weights = 'yolov5n.pt',
   [int]$Img = 640,
-  [string]$Device = 'cpu'
+  [string]$Device = 'cpu',
+  [switch]$Dynamic
 )
 
 # Strict error handling
@@ -69,6 +71,7 @@ if (-not (Test-Path (Join-Path $yoloDir 'export.py'))) {
 Push-Location $yoloDir
 try {
   $args = @('--weights', "$weightsPath", '--include', 'onnx', '--img', "$Img", '--device', "$Device")
+  if ($Dynamic) { $args += '--dynamic' }
   Write-Host "Running: $python export.py $($args -join ' ')"
   & $python export.py @args
 } catch {
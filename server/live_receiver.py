@@ -3,8 +3,8 @@
 This FastAPI app exposes a WebSocket endpoint at /ws/live that accepts JSON messages
 containing `frame_id` and `image_b64` (data URL or raw base64). For each incoming frame
 it runs inference using the helper functions and loaded model(s) from `main.py`, draws
-overlay boxes on the image, then returns a JSON message with detections and an
-annotated image (base64 JPEG data URL).
+overlay boxes on the already-decoded frame, then returns a JSON message with detections
+followed by the annotated JPEG as a separate binary frame.
 
 Run with:
     uvicorn live_receiver:app --host 0.0.0.0 --port 8001
@@ -12,181 +12,138 @@ Run with:
 Client message format (text JSON):
     { "frame_id": "frame-1", "image_b64": "data:image/jpeg;base64,..." }
 
-Server response format (text JSON):
+Server response format (text JSON header):
     {
       "frame_id": "frame-1",
       "capture_ts": 169...,     # ms
       "inference_ts": 169...,   # ms
       "detections": [ {label, score, xmin,ymin,xmax,ymax}, ... ],
-      "annotated_b64": "data:image/jpeg;base64,..."
+      "annotated": true         # a binary frame with the annotated JPEG follows
     }
+When "annotated" is true the next message is a binary frame holding the raw JPEG bytes
+(no base64), which clients can display via a Blob URL.
 
 This file intentionally re-uses preprocessing and NMS helpers from `main.py` to
 keep model/load logic consistent with the existing server.
 """
 
-import base64
-import io
 import json
+import logging
+import os
 import time
 import asyncio
+import concurrent.futures
 from typing import Optional
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
-from PIL import Image, ImageDraw
 import numpy as np
+import cv2
 
 import main as model_main
 
 app = FastAPI()
+logger = logging.getLogger('heimdall.live')
 
+# Inference, annotation and JPEG encoding are CPU-bound C calls that release the GIL; running them on
+# pools keeps the event loop free to service other clients' WebSocket I/O in the meantime. Inference gets
+# one worker, like main._infer_pool: each ORT run already spreads over its spinning intra-op threads, so
+# concurrent runs would only oversubscribe the cores. Base64 decode and annotation run on their own pool.
+infer_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='live-infer')
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='live-codec')
 
-def decode_b64_image(b64: str) -> bytes:
-    if b64.startswith('data:'):
-        b64 = b64.split(',', 1)[1]
-    try:
-        return base64.b64decode(b64)
-    except Exception:
-        # try to be forgiving about spaces
-        return base64.b64decode(b64.replace(' ', '+'))
+
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_SCALE = 0.4
 
 
-def draw_detections_on_pil(raw_bytes: bytes, detections: list, show_label: bool = True) -> bytes:
-    im = Image.open(io.BytesIO(raw_bytes)).convert('RGB')
-    draw = ImageDraw.Draw(im)
-    w, h = im.size
+def draw_detections_on_numpy(bgr: np.ndarray, detections: list, show_label: bool = True) -> np.ndarray:
+    """Draw boxes on a decoded BGR frame in place and return the JPEG encoding as a uint8 buffer."""
+    h, w = bgr.shape[:2]
     for d in detections:
         xmin = int(d['xmin'] * w)
         ymin = int(d['ymin'] * h)
         xmax = int(d['xmax'] * w)
         ymax = int(d['ymax'] * h)
         # box
-        draw.rectangle([xmin, ymin, xmax, ymax], outline=(255, 0, 0), width=2)
+        cv2.rectangle(bgr, (xmin, ymin), (xmax, ymax), (0, 0, 255), 2)
         if show_label:
             label = f"{d['label']} {d['score']:.2f}"
-            text_size = draw.textsize(label)
-            draw.rectangle([xmin, ymin - text_size[1] - 4, xmin + text_size[0] + 4, ymin], fill=(255, 0, 0))
-            draw.text((xmin + 2, ymin - text_size[1] - 2), label, fill=(255, 255, 255))
-    buf = io.BytesIO()
-    im.save(buf, format='JPEG', quality=80)
-    return buf.getvalue()
+            (text_w, text_h), _ = cv2.getTextSize(label, LABEL_FONT, LABEL_SCALE, 1)
+            cv2.rectangle(bgr, (xmin, ymin - text_h - 4), (xmin + text_w + 4, ymin), (0, 0, 255), -1)
+            cv2.putText(bgr, label, (xmin + 2, ymin - 2), LABEL_FONT, LABEL_SCALE, (255, 255, 255), 1, cv2.LINE_AA)
+    # libjpeg-turbo via OpenCV encodes straight into one numpy buffer
+    ok, enc = cv2.imencode('.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    if not ok:
+        raise RuntimeError('JPEG encode failed')
+    return enc
+
+
+def encode_annotated_jpeg(raw_bytes: bytes, decoded: Optional[np.ndarray], detections: list) -> bytes:
+    # Draw on the BGR frame decoded during preprocessing; only decode here when inference did not run
+    if decoded is not None:
+        bgr = decoded
+    else:
+        bgr = cv2.imdecode(np.frombuffer(raw_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return draw_detections_on_numpy(bgr, detections, show_label=True).tobytes()
 
 
-async def ensure_model_loaded():
-    # Ensure ONNX or PT model is loaded (mirrors logic in main.py)
-    if model_main.onnx_session is not None or model_main.torch_model is not None:
-        return
-    model_path = model_main.find_onnx_model()
-    if model_path:
-        model_main.onnx_session = model_main.load_onnx_model(model_path)
-        if model_main.onnx_session is not None:
-            model_main.loaded_model_type = 'onnx'
-            model_main.loaded_model_path = model_path
-            print(f"[live_receiver] loaded ONNX model: {model_path}")
-            return
-    # try PT fallback
-    pt = model_main.find_pt_model()
-    if pt:
-        try:
-            import torch
-            from models.experimental import attempt_load
-            model_main.torch_model = attempt_load(pt, map_location='cpu')
-            model_main.torch_model.eval()
-            model_main.loaded_model_type = 'pt'
-            model_main.loaded_model_path = pt
-            print(f"[live_receiver] loaded PT model: {pt}")
-        except Exception:
-            model_main.torch_model = None
-
-
-async def run_inference_on_bytes(raw: bytes) -> list:
-    # Preprocess
+@app.on_event('startup')
+async def load_models():
+    # same ONNX-then-PT selection as main.py, done once before the first connection
+    model_main.load_models()
+    print(f"[live_receiver] loaded model: {model_main.loaded_model_type} {model_main.loaded_model_path}")
+
+
+def preprocess(raw: bytes, out: Optional[np.ndarray] = None):
     try:
-        img_arr, orig_w, orig_h, r, dw, dh = model_main.preprocess_image_bytes(raw, img_size=model_main.model_input_size)
+        return model_main.preprocess_image_bytes(raw, img_size=model_main.model_input_size, out=out)
     except Exception as e:
         raise RuntimeError(f'preprocess failed: {e}')
 
-    dets = []
-    # ONNX
-    if model_main.onnx_session is not None:
-        input_name = model_main.onnx_session.get_inputs()[0].name
-        outputs = model_main.onnx_session.run(None, {input_name: img_arr})
-        preds = None
-        for out in outputs:
-            if isinstance(out, np.ndarray) and out.ndim == 3:
-                preds = out[0]
-                break
-        if preds is None:
-            preds = outputs[0][0]
-        try:
-            print(f"[live_receiver] ONNX outputs count: {len(outputs)}; preds shape: {None if preds is None else getattr(preds,'shape',None)}")
-            # debug some preds statistics to help diagnose filtering
-            try:
-                obj_scores = preds[:, 4]
-                print(f"[live_receiver] ONNX objectness scores: min={float(obj_scores.min()):.6f}, max={float(obj_scores.max()):.6f}, mean={float(obj_scores.mean()):.6f}")
-                # show top 8 objectness scores
-                top_idx = obj_scores.argsort()[-8:][::-1]
-                print('[live_receiver] ONNX top objectness samples:', [float(obj_scores[i]) for i in top_idx])
-                # show first prediction row (x,y,w,h,obj, then first 6 class probs)
-                sample = preds[0]
-                print('[live_receiver] ONNX preds[0,:10]:', [float(x) for x in sample[:10]])
-            except Exception:
-                pass
-        except Exception:
-            pass
-        dets = model_main.non_max_suppression(preds, conf_thres=model_main.conf_threshold, iou_thres=model_main.iou_threshold)
-    # PT
-    elif model_main.torch_model is not None:
-        try:
-            import torch
-            inp = torch.from_numpy(img_arr).to('cpu')
-            with torch.no_grad():
-                y = model_main.torch_model(inp)
-            if isinstance(y, (list, tuple)):
-                y0 = y[0]
-            else:
-                y0 = y
-            preds = y0.detach().cpu().numpy()
-            if preds.ndim == 3:
-                preds = preds[0]
-            elif preds.ndim == 2:
-                preds = preds
-            else:
-                preds = preds.reshape(-1, preds.shape[-1])
-            try:
-                print(f"[live_receiver] PT preds shape: {preds.shape}")
-            except Exception:
-                pass
-            dets = model_main.non_max_suppression(preds, conf_thres=model_main.conf_threshold, iou_thres=model_main.iou_threshold)
-        except Exception as e:
-            raise RuntimeError(f'pt inference failed: {e}')
-    else:
-        # no model
-        return []
 
+def onnx_forward(raw: bytes):
+    # Preprocess into this pool thread's bound input tensor, run without an input copy, then select,
+    # NMS and rescale here too: the preallocated outputs are consumed before this thread runs again,
+    # and none of the per-frame numpy work lands on the event loop
+    session = model_main.onnx_session
+    binding, in_buf = model_main.get_io_binding(session)
+    _, orig_w, orig_h, r, dw, dh, decoded = preprocess(raw, out=in_buf)
+    preds = model_main._select_preds(model_main.run_io_binding(session, binding))
+    return postprocess(preds, orig_w, orig_h, r, dw, dh), decoded
+
+
+def pt_forward(raw: bytes):
+    img_arr, orig_w, orig_h, r, dw, dh, decoded = preprocess(raw)
+    try:
+        preds = model_main._pt_preds(img_arr)
+    except Exception as e:
+        raise RuntimeError(f'pt inference failed: {e}')
+    return postprocess(preds, orig_w, orig_h, r, dw, dh), decoded
+
+
+def postprocess(preds: np.ndarray, orig_w, orig_h, r, dw, dh) -> list:
+    dets = model_main.non_max_suppression(preds, conf_thres=model_main.conf_threshold, iou_thres=model_main.iou_threshold)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('preds shape %s, objectness max %.6f, raw dets %d', preds.shape, float(preds[:, 4].max()), len(dets[1]))
     # Map boxes back to original image space and normalize
-    detections = []
-    print(f"[live_receiver] raw dets count: {len(dets)}")
-    for d in dets:
-        x1, y1, x2, y2, score, cls = d
-        x1 = max(0, (x1 - dw) / r)
-        x2 = max(0, (x2 - dw) / r)
-        y1 = max(0, (y1 - dh) / r)
-        y2 = max(0, (y2 - dh) / r)
-        xmin = x1 / orig_w
-        ymin = y1 / orig_h
-        xmax = x2 / orig_w
-        ymax = y2 / orig_h
-        label = model_main.COCO_NAMES[int(cls)] if int(cls) < len(model_main.COCO_NAMES) else str(int(cls))
-        detections.append({'label': label, 'score': float(score), 'xmin': float(xmin), 'ymin': float(ymin), 'xmax': float(xmax), 'ymax': float(ymax)})
-    return detections
+    return model_main.scale_detections(dets, orig_w, orig_h, r, dw, dh)
+
+
+async def run_inference_on_bytes(raw: bytes):
+    """Return (detections, decoded BGR frame or None when no model is loaded)."""
+    loop = asyncio.get_running_loop()
+    if model_main.onnx_session is not None:
+        return await loop.run_in_executor(infer_executor, onnx_forward, raw)
+    if model_main.torch_model is not None:
+        return await loop.run_in_executor(infer_executor, pt_forward, raw)
+    # no model
+    return [], None
 
 
 @app.websocket('/ws/live')
 async def websocket_live(ws: WebSocket):
     await ws.accept()
-    await ensure_model_loaded()
     try:
         while True:
             msg = await ws.receive_text()
@@ -202,22 +159,17 @@ async def websocket_live(ws: WebSocket):
                 await ws.send_text(json.dumps({'error': 'image_b64 missing', 'frame_id': frame_id}))
                 continue
 
-            # log brief info so operator can see frame arrival in uvicorn logs
-            try:
-                print(f"[live_receiver] got frame_id={frame_id} image_b64_len={len(b64)}")
-            except Exception:
-                # best-effort logging; don't crash on print issues
-                pass
+            logger.debug('got frame_id=%s image_b64_len=%d', frame_id, len(b64))
 
             try:
-                raw = decode_b64_image(b64)
+                raw = await asyncio.get_running_loop().run_in_executor(executor, model_main.decode_image_b64, b64)
             except Exception as e:
                 await ws.send_text(json.dumps({'error': 'base64 decode failed', 'detail': str(e), 'frame_id': frame_id}))
                 continue
 
             start = int(time.time() * 1000)
             try:
-                detections = await run_inference_on_bytes(raw)
+                detections, decoded = await run_inference_on_bytes(raw)
             except Exception as e:
                 await ws.send_text(json.dumps({'error': 'inference failed', 'detail': str(e), 'frame_id': frame_id}))
                 continue
@@ -225,19 +177,22 @@ async def websocket_live(ws: WebSocket):
 
             # draw annotated image
             try:
-                annotated = draw_detections_on_pil(raw, detections, show_label=True)
-                annotated_b64 = 'data:image/jpeg;base64,' + base64.b64encode(annotated).decode('ascii')
+                annotated = await asyncio.get_running_loop().run_in_executor(
+                    executor, encode_annotated_jpeg, raw, decoded, detections)
             except Exception as e:
-                annotated_b64 = None
+                annotated = None
 
             out = {
                 'frame_id': frame_id,
                 'capture_ts': start,
                 'inference_ts': inf_time,
                 'detections': detections,
-                'annotated_b64': annotated_b64
+                'annotated': annotated is not None
             }
             await ws.send_text(json.dumps(out))
+            # JPEG travels as its own binary frame: no base64 pass and 25% fewer bytes on the wire
+            if annotated is not None:
+                await ws.send_bytes(annotated)
 
     except WebSocketDisconnect:
         return
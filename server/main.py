@@ -1,17 +1,21 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 import asyncio
-import json
 import time
 import logging
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 import websockets
 import os
+import re
+import uuid
 import base64
-import io
+import binascii
 import numpy as np
-from PIL import Image
+import cv2
+import orjson
 import onnxruntime as ort
 import importlib
 import traceback
@@ -22,18 +26,39 @@ try:
 	import psutil
 except Exception:
 	psutil = None
+try:
+	import numba
+except Exception:
+	numba = None
 
-app = FastAPI()
-logger = logging.getLogger("heimdall")
-logging.basicConfig(level=logging.INFO)
 
-# Allow CORS from frontend during development
+class ORJSONResponse(JSONResponse):
+	"""JSONResponse rendered with orjson, which also serializes numpy scalars and arrays natively."""
+
+	def render(self, content) -> bytes:
+		return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+app = FastAPI(default_response_class=ORJSONResponse)
+logger = logging.getLogger("heimdall")
+# LOG_LEVEL=WARNING keeps per-request log work off the hot path in production
+_log_level_name = os.environ.get('LOG_LEVEL', 'INFO').upper()
+_log_level = logging.getLevelName(_log_level_name)
+logging.basicConfig(level=_log_level if isinstance(_log_level, int) else logging.INFO)
+if not isinstance(_log_level, int):
+	logger.warning('Unknown LOG_LEVEL %r; using INFO', _log_level_name)
+
+# Allow CORS from the frontend. FRONTEND_ORIGIN is a comma-separated list (default "*" for development).
+# Methods and headers are limited to what the endpoints use, and browsers may cache the preflight for a
+# day instead of repeating it ahead of the per-frame POSTs.
+FRONTEND_ORIGINS = [o.strip() for o in os.environ.get('FRONTEND_ORIGIN', '*').split(',') if o.strip()]
 app.add_middleware(
 	CORSMiddleware,
-	allow_origins=["*"],
+	allow_origins=FRONTEND_ORIGINS,
 	allow_credentials=True,
-	allow_methods=["*"],
-	allow_headers=["*"],
+	allow_methods=["POST", "GET"],
+	allow_headers=["Content-Type", "X-Frame-Id", "X-Tensor-Dtype", "X-Tensor-Shape", "X-Original-Size"],
+	max_age=86400,
 )
 
 # ONNX model/session globals
@@ -41,6 +66,8 @@ onnx_session = None
 torch_model = None
 loaded_model_type = None  # 'onnx' or 'pt' or None
 loaded_model_path = None
+torch_device = 'cpu'
+torch_half = False
 model_input_size = 640
 conf_threshold = 0.25
 iou_threshold = 0.45
@@ -57,37 +84,110 @@ COCO_NAMES = [
 ]
 
 
+# Execution providers in order of preference; only those available in the installed onnxruntime build are used
+PREFERRED_PROVIDERS = ['CUDAExecutionProvider', 'OpenVINOExecutionProvider', 'CPUExecutionProvider']
+
+
+def quantize_onnx_model(path: str):
+	"""Write a dynamically INT8-quantized copy of `path` next to it (once) and return its path."""
+	# .dynint8.onnx, not .int8.onnx: find_onnx_models always prefers the latter, so a copy left behind
+	# by one QUANTIZE_INT8=1 run would otherwise be loaded on every later run without the flag
+	qpath = os.path.splitext(path)[0] + '.dynint8.onnx'
+	if os.path.exists(qpath):
+		return qpath
+	try:
+		from onnxruntime.quantization import quantize_dynamic, QuantType
+		logger.info('Quantizing ONNX model to %s', qpath)
+		# YOLOv5 is all convolutions, which become ConvInteger; the CPU kernel only takes uint8 weights
+		quantize_dynamic(path, qpath, weight_type=QuantType.QUInt8)
+		# make sure the result actually loads before it is preferred on every later start
+		ort.InferenceSession(qpath, providers=['CPUExecutionProvider'])
+		return qpath
+	except Exception:
+		logger.exception('Failed to quantize ONNX model; using FP32')
+		if os.path.exists(qpath):
+			os.remove(qpath)
+		return None
+
+
+def _session_options(optimized_model_filepath: Optional[str] = None) -> ort.SessionOptions:
+	so = ort.SessionOptions()
+	# one frame is one sequential graph: parallelize inside ops, never across them
+	so.intra_op_num_threads = int(os.environ.get('ONNX_INTRA_THREADS', max(1, (os.cpu_count() or 2) // 2)))
+	so.inter_op_num_threads = 1
+	so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+	# frames arrive back to back, so keep intra-op workers spinning instead of parking them between runs
+	so.add_session_config_entry('session.intra_op.allow_spinning', '1')
+	# input shapes are fixed, so the memory pattern planned on the first run is reused by every later run
+	so.enable_mem_pattern = True
+	so.enable_cpu_mem_arena = True
+	if optimized_model_filepath:
+		so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+		so.optimized_model_filepath = optimized_model_filepath
+	else:
+		# the graph was already optimized when it was cached
+		so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+	return so
+
+
 def load_onnx_model(path: str):
 	global onnx_session
 	if not os.path.exists(path):
 		logger.warning('ONNX model not found at %s', path)
 		return None
 	try:
-		logger.info('Loading ONNX model from %s', path)
-		so = ort.SessionOptions()
-		so.intra_op_num_threads = int(os.environ.get('ONNX_INTRA_THREADS', 1))
-		so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-		sess = ort.InferenceSession(path, sess_options=so, providers=['CPUExecutionProvider'])
-		logger.info('ONNX model loaded')
+		# QUANTIZE_INT8=1 prefers an INT8 copy of the model (VNNI on modern CPUs)
+		if os.environ.get('QUANTIZE_INT8', '0') == '1' and not path.endswith('int8.onnx'):
+			path = quantize_onnx_model(path) or path
+		available = ort.get_available_providers()
+		providers = [p for p in PREFERRED_PROVIDERS if p in available]
+		# Optimized graphs are provider specific, so the cache is keyed on the primary provider. It is
+		# written on the first load and reused until the source model is newer.
+		tag = providers[0].replace('ExecutionProvider', '').lower()
+		opt_path = '%s.%s.opt.onnx' % (os.path.splitext(path)[0], tag)
+		sess = None
+		if os.path.exists(opt_path) and os.path.getmtime(opt_path) >= os.path.getmtime(path):
+			try:
+				logger.info('Loading optimized ONNX model from %s', opt_path)
+				sess = ort.InferenceSession(opt_path, sess_options=_session_options(), providers=providers)
+			except Exception:
+				logger.exception('Failed to load cached optimized model; re-optimizing %s', path)
+		if sess is None:
+			logger.info('Loading ONNX model from %s', path)
+			try:
+				sess = ort.InferenceSession(path, sess_options=_session_options(opt_path), providers=providers)
+			except Exception:
+				# some providers cannot serialize their optimized graph; load without caching it
+				logger.warning('Could not cache optimized graph to %s; loading without it', opt_path)
+				so = _session_options()
+				so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+				sess = ort.InferenceSession(path, sess_options=so, providers=providers)
+		logger.info('ONNX model loaded with providers %s', sess.get_providers())
+		# cache I/O names so per-request code does not cross into the native session for them
+		sess._heimdall_input_name = sess.get_inputs()[0].name
+		sess._heimdall_output_names = [o.name for o in sess.get_outputs()]
+		# the model actually serving, which QUANTIZE_INT8 may have swapped for a quantized copy
+		sess._heimdall_model_path = path
 		return sess
 	except Exception as e:
 		logger.exception('Failed to load ONNX model: %s', e)
 		return None
 
 
-def find_onnx_model():
-	# Search common locations for the exported yolov5n.onnx
-	candidates = [
-		os.path.join(os.getcwd(), 'models', 'yolov5n.onnx'),
-		os.path.join(os.getcwd(), 'yolov5', 'yolov5n.onnx'),
-		os.path.join(os.getcwd(), 'server', 'yolov5', 'yolov5n.onnx'),
-	]
-	for p in candidates:
-		if os.path.exists(p):
-			logger.info('Found ONNX model at %s', p)
-			return p
-	logger.warning('No ONNX model found in candidates: %s', candidates)
-	return None
+def find_onnx_models() -> list:
+	# Search common locations for the exported yolov5n.onnx and return every one found in load order,
+	# with a statically quantized yolov5n.int8.onnx (see quantize_onnx.py) ahead of the FP32 model
+	# in the same directory
+	candidates = []
+	for d in (os.path.join(os.getcwd(), 'models'), os.path.join(os.getcwd(), 'yolov5'), os.path.join(os.getcwd(), 'server', 'yolov5')):
+		candidates.append(os.path.join(d, 'yolov5n.int8.onnx'))
+		candidates.append(os.path.join(d, 'yolov5n.onnx'))
+	found = [p for p in candidates if os.path.exists(p)]
+	if found:
+		logger.info('Found ONNX models at %s', found)
+	else:
+		logger.warning('No ONNX model found in candidates: %s', candidates)
+	return found
 
 
 def find_pt_model():
@@ -104,128 +204,458 @@ def find_pt_model():
 	return None
 
 
-# Try to load model at startup if present
-startup_model = find_onnx_model()
-if startup_model:
-	onnx_session = load_onnx_model(startup_model)
-	if onnx_session is not None:
-		loaded_model_type = 'onnx'
-		loaded_model_path = startup_model
+def load_pt_model(path: str):
+	"""Load a YOLOv5 .pt checkpoint: FP16 on CUDA, FP32 otherwise."""
+	global torch_device, torch_half
+	import torch
+	from models.experimental import attempt_load
+	model = attempt_load(path, map_location='cpu')
+	model.eval()
+	if torch.cuda.is_available():
+		model = model.to('cuda').half()
+		torch_device, torch_half = 'cuda', True
+	elif os.environ.get('QUANTIZE_INT8', '0') == '1':
+		# YOLOv5 has no Linear layers for torch dynamic quantization to act on
+		logger.warning('QUANTIZE_INT8 only applies to ONNX models; the PyTorch fallback stays FP32')
+	return model
+
+
+def torch_forward(img_arr: np.ndarray) -> np.ndarray:
+	import torch
+	inp = torch.from_numpy(img_arr).to(torch_device)
+	if torch_half:
+		inp = inp.half()
+	with torch.no_grad():
+		y = torch_model(inp)
+	if isinstance(y, (list, tuple)):
+		y0 = y[0]
 	else:
-		# attempt PT fallback
-		pt = find_pt_model()
-		if pt:
-			try:
-				import torch
-				from models.experimental import attempt_load
-				logger.info('Loading PyTorch model from %s', pt)
-				torch_model = attempt_load(pt, map_location='cpu')
-				torch_model.eval()
-				loaded_model_type = 'pt'
-				loaded_model_path = pt
-				logger.info('PyTorch model loaded')
-			except Exception:
-				logger.exception('Failed to load PT model')
-
-
-def letterbox(im: Image.Image, new_shape=(640, 640), color=(114, 114, 114)):
-	# Resize and pad image to meet new_shape while keeping aspect ratio
-	shape = im.size[::-1]  # (h, w)
-	r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
-	new_unpad = (int(round(shape[1] * r)), int(round(shape[0] * r)))
-	dw = new_shape[1] - new_unpad[0]
-	dh = new_shape[0] - new_unpad[1]
-	dw /= 2
-	dh /= 2
-	im_resized = im.resize(new_unpad, Image.BILINEAR)
-	new_im = Image.new('RGB', (new_shape[1], new_shape[0]), color)
-	new_im.paste(im_resized, (int(dw), int(dh)))
+		y0 = y
+	return y0.detach().float().cpu().numpy()
+
+
+def load_models():
+	"""Load the ONNX model, or the PyTorch fallback, into the module globals unless one is loaded already."""
+	global onnx_session, torch_model, loaded_model_type, loaded_model_path
+	if onnx_session is not None or torch_model is not None:
+		return
+	# a model that fails to load falls through to the next ONNX candidate before the PyTorch model
+	for onnx_path in find_onnx_models():
+		onnx_session = load_onnx_model(onnx_path)
+		if onnx_session is not None:
+			loaded_model_type = 'onnx'
+			loaded_model_path = onnx_session._heimdall_model_path
+			return
+	# attempt PT fallback
+	pt = find_pt_model()
+	if pt:
+		try:
+			logger.info('Loading PyTorch model from %s', pt)
+			torch_model = load_pt_model(pt)
+			loaded_model_type = 'pt'
+			loaded_model_path = pt
+			logger.info('PyTorch model loaded')
+			return
+		except Exception:
+			logger.exception('Failed to load PT model')
+	logger.warning('No model loaded; inference requests will be rejected')
+
+
+def letterbox_params(w: int, h: int, new_shape=(640, 640)):
+	# Scale, resized (w, h) and per-side padding that letterboxing a w x h image into new_shape uses
+	r = min(new_shape[0] / h, new_shape[1] / w)
+	new_unpad = (int(round(w * r)), int(round(h * r)))
+	dw = (new_shape[1] - new_unpad[0]) / 2
+	dh = (new_shape[0] - new_unpad[1]) / 2
+	return r, new_unpad, dw, dh
+
+
+def letterbox(im: np.ndarray, new_shape=(640, 640), color=(114, 114, 114)):
+	# Resize and pad an HxWx3 uint8 image to meet new_shape while keeping aspect ratio
+	shape = im.shape[:2]  # (h, w)
+	r, new_unpad, dw, dh = letterbox_params(shape[1], shape[0], new_shape)
+	if (shape[1], shape[0]) != new_unpad:
+		im = cv2.resize(im, new_unpad, interpolation=cv2.INTER_LINEAR)
+	top, left = int(dh), int(dw)
+	bottom = new_shape[0] - new_unpad[1] - top
+	right = new_shape[1] - new_unpad[0] - left
+	new_im = cv2.copyMakeBorder(im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
 	return new_im, r, (dw, dh)
 
 
-def preprocess_image_bytes(img_bytes: bytes, img_size=640):
-	im = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-	orig_w, orig_h = im.size
+def preprocess_image_bytes(img_bytes: bytes, img_size=640, out: Optional[np.ndarray] = None):
+	# `out` is an optional preallocated (1, 3, img_size, img_size) float32 tensor to fill in place.
+	# The decoded HxWx3 uint8 BGR frame is returned too so callers can annotate it without decoding again.
+	im = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+	if im is None:
+		raise ValueError('could not decode image bytes')
+	orig_h, orig_w = im.shape[:2]
 	img, r, (dw, dh) = letterbox(im, new_shape=(img_size, img_size))
-	img_arr = np.array(img).astype(np.float32)
-	# normalize 0..1
-	img_arr /= 255.0
-	# HWC to CHW
-	img_arr = np.transpose(img_arr, (2, 0, 1))
-	img_arr = np.expand_dims(img_arr, 0).astype(np.float32)
-	return img_arr, orig_w, orig_h, r, dw, dh
+	if out is None:
+		out = np.empty((1, 3, img_size, img_size), dtype=np.float32)
+	# HWC to CHW, BGR to RGB (reversed channel view) and normalize 0..1 in a single pass into the target tensor
+	np.divide(img.transpose(2, 0, 1)[::-1], np.float32(255.0), out=out[0], dtype=np.float32)
+	return out, orig_w, orig_h, r, dw, dh, im
+
+
+# Per-thread IO binding for the ONNX session. Frames are preprocessed straight into a persistent input
+# tensor that ORT reads in place (a CPU OrtValue shares the numpy buffer), instead of allocating a new
+# array and having ORT copy it in on every run. Thread-local because inference may run on several
+# pool threads at once.
+_io_local = threading.local()
+
+
+def get_io_binding(sess):
+	"""Return (io_binding, input_buffer) for `sess` on the calling thread, creating them on first use.
+
+	Outputs with a fully static shape are bound to preallocated buffers as well, so a run allocates nothing.
+	"""
+	state = getattr(_io_local, 'state', None)
+	if state is None or state[0] is not sess:
+		in_buf = np.empty((1, 3, model_input_size, model_input_size), dtype=np.float32)
+		ort_in = ort.OrtValue.ortvalue_from_numpy(in_buf)
+		binding = sess.io_binding()
+		binding.bind_ortvalue_input(sess._heimdall_input_name, ort_in)
+		outs = sess.get_outputs()
+		out_bufs = None
+		if all(o.type == 'tensor(float)' and all(isinstance(d, int) for d in o.shape) for o in outs):
+			out_bufs = [np.empty(o.shape, dtype=np.float32) for o in outs]
+			for o, buf in zip(outs, out_bufs):
+				binding.bind_ortvalue_output(o.name, ort.OrtValue.ortvalue_from_numpy(buf))
+		else:
+			for o in outs:
+				binding.bind_output(o.name, 'cpu')
+		state = (sess, binding, in_buf, ort_in, out_bufs)
+		_io_local.state = state
+	return state[1], state[2]
+
+
+def run_io_binding(sess, binding) -> list:
+	"""Run `sess` on the bound input and return its outputs as numpy arrays.
+
+	Preallocated outputs are returned without a copy and are overwritten by the next run on this thread.
+	"""
+	sess.run_with_iobinding(binding)
+	state = _io_local.state
+	if state[1] is binding and state[4] is not None:
+		return state[4]
+	return binding.copy_outputs_to_cpu()
+
+
+# Dynamic micro-batching: when the ONNX model has a dynamic batch axis, concurrent infer_frame requests
+# are collected for up to BATCH_WINDOW_MS (at most MAX_BATCH_SIZE frames) and run as one batched call,
+# so the per-run dispatch and thread-pool wakeup cost is paid once per batch instead of once per frame.
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '8'))
+BATCH_WINDOW_MS = float(os.environ.get('BATCH_WINDOW_MS', '5'))
+_batch_queue: Optional[asyncio.Queue] = None
+_batch_task = None
+
+
+def has_dynamic_batch(sess) -> bool:
+	return not isinstance(sess.get_inputs()[0].shape[0], int)
+
+
+def _run_batch(sess, batch: np.ndarray) -> np.ndarray:
+	outputs = sess.run(sess._heimdall_output_names, {sess._heimdall_input_name: batch})
+	return _select_preds(outputs, batched=True)
+
+
+def _fail_pending(pending, exc: BaseException):
+	for _, fut in pending:
+		if not fut.done():
+			fut.set_exception(exc)
+
+
+async def _batch_worker(sess):
+	loop = asyncio.get_running_loop()
+	window = BATCH_WINDOW_MS / 1000.0
+	# one batch is in flight at a time, so a single staging tensor is enough
+	batch_buf = np.empty((MAX_BATCH_SIZE, 3, model_input_size, model_input_size), dtype=np.float32)
+	while True:
+		pending = []
+		# the whole body is guarded so no future is left unresolved: on an error the current batch fails
+		# and the loop carries on, and on cancellation everything still queued fails as well
+		try:
+			pending.append(await _batch_queue.get())
+			deadline = loop.time() + window
+			while len(pending) < MAX_BATCH_SIZE:
+				remaining = deadline - loop.time()
+				if remaining <= 0:
+					break
+				try:
+					pending.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+				except asyncio.TimeoutError:
+					break
+			n = len(pending)
+			np.concatenate([img for img, _ in pending], axis=0, out=batch_buf[:n])
+			preds = await loop.run_in_executor(_infer_pool, _run_batch, sess, batch_buf[:n])
+			for i, (_, fut) in enumerate(pending):
+				if not fut.done():
+					fut.set_result(preds[i])
+		except asyncio.CancelledError:
+			while not _batch_queue.empty():
+				pending.append(_batch_queue.get_nowait())
+			_fail_pending(pending, RuntimeError('inference batcher stopped'))
+			raise
+		except Exception as e:
+			logger.exception('Inference batch failed: %s', e)
+			_fail_pending(pending, e)
+
+
+async def submit_for_inference(img_arr: np.ndarray) -> np.ndarray:
+	"""Queue one (1, 3, S, S) tensor for the next batch and return its (N, 85) predictions."""
+	if _batch_task is None or _batch_task.done():
+		raise RuntimeError('inference batcher is not running')
+	fut = asyncio.get_running_loop().create_future()
+	await _batch_queue.put((img_arr, fut))
+	return await fut
+
+
+def start_batcher():
+	global _batch_queue, _batch_task
+	if onnx_session is None or MAX_BATCH_SIZE <= 1 or not has_dynamic_batch(onnx_session):
+		return
+	_batch_queue = asyncio.Queue()
+	_batch_task = asyncio.create_task(_batch_worker(onnx_session))
+	logger.info('Micro-batching enabled: up to %d frames per %.1f ms window', MAX_BATCH_SIZE, BATCH_WINDOW_MS)
+
+
+if numba is not None:
+	def _nms_greedy(boxes, scores, cls_ids, iou_thres):
+		# Greedy per-class NMS as a scalar loop: no (N, N) IoU matrix, and the overlap test is
+		# inter > thres * union, so the inner loop has no division. Returns kept row indices.
+		n = scores.shape[0]
+		order = np.argsort(-scores, kind='mergesort')
+		area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+		suppressed = np.zeros(n, dtype=np.bool_)
+		keep = np.empty(n, dtype=np.int32)
+		k = 0
+		for a in range(n):
+			i = order[a]
+			if suppressed[i]:
+				continue
+			keep[k] = i
+			k += 1
+			for b in range(a + 1, n):
+				j = order[b]
+				if suppressed[j] or cls_ids[j] != cls_ids[i]:
+					continue
+				# disjoint boxes are the common case; leave before touching the y extent or multiplying
+				iw = min(boxes[i, 2], boxes[j, 2]) - max(boxes[i, 0], boxes[j, 0])
+				if iw <= 0.0:
+					continue
+				ih = min(boxes[i, 3], boxes[j, 3]) - max(boxes[i, 1], boxes[j, 1])
+				if ih <= 0.0:
+					continue
+				inter = iw * ih
+				if inter > iou_thres * (area[i] + area[j] - inter):
+					suppressed[j] = True
+		return keep[:k]
+
+	# jit and compile (or load from the on-disk cache) now so the first request does not pay for it.
+	# A failed compile or an unwritable cache directory must not break importing this module
+	# (live_receiver.py and quantize_onnx.py import it too), so fall back to the NumPy path instead.
+	try:
+		nms_numba = numba.njit(cache=True, fastmath=True)(_nms_greedy)
+		nms_numba(np.zeros((1, 4), dtype=np.float32), np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.int32), np.float32(iou_threshold))
+	except Exception:
+		logger.exception('Failed to compile numba NMS; using NumPy Fast-NMS')
+		nms_numba = None
+else:
+	nms_numba = None
 
 
-def xywh2xyxy(x):
-	# x is [x_center, y_center, w, h]
-	y = np.copy(x)
-	y[0] = x[0] - x[2] / 2
-	y[1] = x[1] - x[3] / 2
-	y[2] = x[0] + x[2] / 2
-	y[3] = x[1] + x[3] / 2
-	return y
+def _no_detections():
+	return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32)
 
 
 def non_max_suppression(predictions, conf_thres=0.25, iou_thres=0.45):
-	# predictions: (N, 85) [x, y, w, h, conf, class_probs...]
-	boxes = []
+	"""Filter (N, 85) [x, y, w, h, conf, class_probs...] rows and return (boxes, scores, cls_ids).
+
+	boxes is (K, 4) xyxy float32, scores (K,) float32 and cls_ids (K,) int32, kept as parallel arrays.
+	"""
 	if predictions is None:
-		return []
+		return _no_detections()
+	# NMS is bound by memory traffic on the (N, N) IoU temporaries, so pin every stage to float32:
+	# float64 input would double that traffic, and float16 would recompile nms_numba per dtype
+	predictions = np.ascontiguousarray(predictions, dtype=np.float32)
 	# filter by confidence
 	scores = predictions[:, 4]
 	mask = scores > conf_thres
 	preds = predictions[mask]
 	if preds.shape[0] == 0:
+		return _no_detections()
+	# convert to xyxy and compute class scores for all candidates at once
+	xy = preds[:, 0:2]
+	half_wh = preds[:, 2:4] / 2
+	class_probs = preds[:, 5:]
+	class_ids = class_probs.argmax(axis=1)
+	scores = preds[:, 4] * class_probs[np.arange(len(preds)), class_ids]
+	keep = scores >= conf_thres
+	if not keep.any():
+		return _no_detections()
+	boxes = np.concatenate([xy - half_wh, xy + half_wh], axis=1)[keep]
+	scores = scores[keep]
+	class_ids = class_ids[keep].astype(np.int32)
+
+	if nms_numba is not None:
+		keep = nms_numba(
+			np.ascontiguousarray(boxes),
+			np.ascontiguousarray(scores),
+			class_ids,
+			np.float32(iou_thres),
+		)
+		return boxes[keep], scores[keep], class_ids[keep]
+
+	# without numba, perform Fast-NMS over all classes at once: shifting each class's boxes by
+	# cls_id * offset (larger than the coordinate span) means boxes of different classes can never
+	# overlap, so one IoU matrix replaces a pass per class. A box is dropped if any higher-scored
+	# box of its class overlaps it, even one that was itself dropped, so this can suppress slightly
+	# more than greedy NMS on dense clusters.
+	order = np.argsort(-scores, kind='stable')
+	offset = np.float32(boxes.max() - boxes.min() + 1)
+	b = boxes[order]
+	area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+	# int32 ids times a float32 scalar would promote to float64; cast first so b stays float32
+	b = b + (class_ids[order].astype(np.float32) * offset)[:, None]
+	x1 = np.maximum(b[:, None, 0], b[None, :, 0])
+	y1 = np.maximum(b[:, None, 1], b[None, :, 1])
+	x2 = np.minimum(b[:, None, 2], b[None, :, 2])
+	y2 = np.minimum(b[:, None, 3], b[None, :, 3])
+	inter = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+	# iou > thres compared as inter > thres * union: no (N, N) division, and union >= 0 keeps it exact
+	overlaps = inter > np.float32(iou_thres) * (area[:, None] + area[None, :] - inter)
+	# row i only suppresses the lower-scored columns j > i
+	keep = order[~np.triu(overlaps, k=1).any(axis=0)]
+	return boxes[keep], scores[keep], class_ids[keep]
+
+
+def scale_detections(dets, orig_w, orig_h, r, dw, dh) -> list:
+	"""Map letterboxed (boxes, scores, cls_ids) from NMS back to normalized original-image detection dicts."""
+	boxes, scores, cls_ids = dets
+	if len(scores) == 0:
 		return []
-	results = []
-	# convert to xyxy and compute class scores
-	for det in preds:
-		x_c, y_c, w, h = det[0:4]
-		conf = det[4]
-		class_probs = det[5:]
-		class_id = int(np.argmax(class_probs))
-		class_conf = class_probs[class_id]
-		score = conf * class_conf
-		if score < conf_thres:
-			continue
-		xyxy = xywh2xyxy(np.array([x_c, y_c, w, h]))
-		results.append([xyxy[0], xyxy[1], xyxy[2], xyxy[3], float(score), class_id])
-
-	if len(results) == 0:
-		return []
+	xyxy = np.maximum(0, (boxes.astype(np.float64) - (dw, dh, dw, dh)) / r) / (orig_w, orig_h, orig_w, orig_h)
+	n_names = len(COCO_NAMES)
+	# all arithmetic is done above; this loop only assembles the JSON-facing dicts
+	return [
+		{'label': COCO_NAMES[c] if c < n_names else str(c), 'score': score, 'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax}
+		for (xmin, ymin, xmax, ymax), score, c in zip(xyxy.tolist(), scores.tolist(), cls_ids.tolist())
+	]
+
+
+_B64_SPACE_FIX = str.maketrans(' ', '+')
+
+
+def decode_image_b64(b64: str) -> bytes:
+	"""Decode a data URL or bare base64 image string into raw bytes."""
+	if b64.startswith('data:'):
+		b64 = b64.split(',', 1)[1]
+	try:
+		# validating rejects stray characters instead of silently skipping them (and is the faster path)
+		return base64.b64decode(b64, validate=True)
+	except binascii.Error:
+		# form-encoded transports turn '+' into ' '; undo that once and retry leniently
+		return base64.b64decode(b64.translate(_B64_SPACE_FIX))
+
+
+# Preprocess, session runs and NMS are CPU-bound, so they run here instead of on the event loop.
+# One worker is enough: ORT parallelizes each run over its intra-op threads and releases the GIL.
+_infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='heimdall-infer')
+
+
+class PreprocessError(Exception):
+	"""Raised by the inference helpers when a frame cannot be decoded or letterboxed."""
+
+
+def _preprocess(raw: bytes, out: Optional[np.ndarray] = None):
+	try:
+		return preprocess_image_bytes(raw, img_size=model_input_size, out=out)
+	except Exception as e:
+		raise PreprocessError(str(e)) from e
+
+
+def _select_preds(outputs, batched: bool = False) -> np.ndarray:
+	# the detection head is the first 3-D output; take its single batch row, or all rows when batched
+	for out in outputs:
+		if isinstance(out, np.ndarray) and out.ndim == 3:
+			return out if batched else out[0]
+	return outputs[0] if batched else outputs[0][0]
+
+
+def infer_onnx_sync(raw: bytes):
+	"""Run one frame end to end on the ONNX IO binding; returns (dets, (orig_w, orig_h, r, dw, dh))."""
+	binding, in_buf = get_io_binding(onnx_session)
+	_, orig_w, orig_h, r, dw, dh, _ = _preprocess(raw, out=in_buf)
+	# the preallocated output is consumed by NMS on this thread before the next run can reuse it
+	preds = _select_preds(run_io_binding(onnx_session, binding))
+	dets = non_max_suppression(preds, conf_thres=conf_threshold, iou_thres=iou_threshold)
+	return dets, (orig_w, orig_h, r, dw, dh)
+
+
+def _pt_preds(img_arr: np.ndarray) -> np.ndarray:
+	preds = torch_forward(img_arr)
+	if preds.ndim == 3:
+		return preds[0]
+	if preds.ndim != 2:
+		return preds.reshape(-1, preds.shape[-1])
+	return preds
+
+
+def infer_pt_sync(raw: bytes):
+	"""Run one frame end to end on the PyTorch model; returns (dets, (orig_w, orig_h, r, dw, dh))."""
+	img_arr, orig_w, orig_h, r, dw, dh, _ = _preprocess(raw)
+	dets = non_max_suppression(_pt_preds(img_arr), conf_thres=conf_threshold, iou_thres=iou_threshold)
+	return dets, (orig_w, orig_h, r, dw, dh)
+
+
+# dtypes accepted by /infer_tensor: floats are already scaled to 0..1, uint8 holds raw 0..255 pixels
+TENSOR_DTYPES = {'float16': np.float16, 'float32': np.float32, 'uint8': np.uint8}
+
+
+def tensor_from_bytes(raw: bytes, dtype, out: Optional[np.ndarray] = None) -> np.ndarray:
+	"""Convert a client-letterboxed (1, 3, S, S) RGB tensor into float32 0..1 in one pass, into `out` if given."""
+	src = np.frombuffer(raw, dtype=dtype).reshape(1, 3, model_input_size, model_input_size)
+	if out is None:
+		out = np.empty(src.shape, dtype=np.float32)
+	if dtype is np.uint8:
+		np.divide(src, np.float32(255.0), out=out, dtype=np.float32)
+	else:
+		np.copyto(out, src)
+	return out
+
+
+def infer_tensor_sync(raw: bytes, dtype) -> tuple:
+	"""Run one client-preprocessed tensor through the loaded model and NMS."""
+	if onnx_session is not None:
+		binding, in_buf = get_io_binding(onnx_session)
+		tensor_from_bytes(raw, dtype, out=in_buf)
+		preds = _select_preds(run_io_binding(onnx_session, binding))
+	else:
+		preds = _pt_preds(tensor_from_bytes(raw, dtype))
+	return non_max_suppression(preds, conf_thres=conf_threshold, iou_thres=iou_threshold)
 
-	# perform NMS per class
-	results = np.array(results)
-	final = []
-	for cls in np.unique(results[:, 5]):
-		cls_mask = results[results[:, 5] == cls]
-		# sort by score
-		idxs = np.argsort(-cls_mask[:, 4])
-		cls_boxes = cls_mask[idxs]
-		keep = []
-		while len(cls_boxes) > 0:
-			box = cls_boxes[0]
-			keep.append(box)
-			if len(cls_boxes) == 1:
-				break
-			rest = cls_boxes[1:]
-			# IoU
-			x1 = np.maximum(box[0], rest[:, 0])
-			y1 = np.maximum(box[1], rest[:, 1])
-			x2 = np.minimum(box[2], rest[:, 2])
-			y2 = np.minimum(box[3], rest[:, 3])
-			inter_w = np.maximum(0, x2 - x1)
-			inter_h = np.maximum(0, y2 - y1)
-			inter = inter_w * inter_h
-			area1 = (box[2] - box[0]) * (box[3] - box[1])
-			area2 = (rest[:, 2] - rest[:, 0]) * (rest[:, 3] - rest[:, 1])
-			union = area1 + area2 - inter
-			iou = inter / (union + 1e-6)
-			cls_boxes = rest[iou <= iou_thres]
-		for k in keep:
-			final.append(k.tolist())
-	return final
 
+@app.on_event('startup')
+async def on_startup():
+	# models load once here, never on the request path
+	load_models()
+	start_batcher()
+	app.state.signaling_task = asyncio.create_task(maintain_signaling_connection(SIGNALING_URL))
+
+
+@app.on_event('shutdown')
+async def on_shutdown():
+	if app.state.signaling_task is not None:
+		app.state.signaling_task.cancel()
+	if _batch_task is not None:
+		# the worker fails every queued future on its way out
+		_batch_task.cancel()
+		try:
+			await _batch_task
+		except asyncio.CancelledError:
+			pass
+	_infer_pool.shutdown(wait=False, cancel_futures=True)
 
 
 class DetectionItem(BaseModel):
@@ -249,13 +679,48 @@ class FramePayload(BaseModel):
 	image_b64: str
 
 
-async def forward_to_signaling(payload: dict, signaling_url: str = "ws://localhost:8080"):
-	# Connect to signaling server as a short-lived publisher client
+# Persistent publisher connection to the signaling server, shared by all requests so each
+# detection costs one frame instead of a TCP + WebSocket handshake. A background task owns the
+# connection and reconnects with exponential backoff; requests only ever send on it.
+SIGNALING_URL = os.environ.get('SIGNALING_URL', 'ws://localhost:8080')
+app.state.signaling_ws = None
+app.state.signaling_send_lock = asyncio.Lock()
+app.state.signaling_task = None
+
+
+async def maintain_signaling_connection(signaling_url: str):
+	delay = 0.5
+	while True:
+		try:
+			async with websockets.connect(signaling_url, ping_interval=20) as ws:
+				app.state.signaling_ws = ws
+				delay = 0.5
+				logger.info('Connected to signaling server at %s', signaling_url)
+				# Signaling broadcasts every peer's messages to this connection too; keep reading so the
+				# receive queue never fills up and stalls keepalive pings
+				async for _ in ws:
+					pass
+		except asyncio.CancelledError:
+			raise
+		except Exception as e:
+			logger.warning('Signaling connection to %s failed: %s; retrying in %.1fs', signaling_url, e, delay)
+		finally:
+			app.state.signaling_ws = None
+		await asyncio.sleep(delay)
+		delay = min(delay * 2, 30.0)
+
+
+async def forward_to_signaling(payload: dict):
+	# Publish over the shared connection; while it is down, fail fast and let the reconnect task recover
+	ws = app.state.signaling_ws
+	if ws is None:
+		raise ConnectionError('not connected to signaling server')
+	# orjson emits UTF-8 bytes; signaling parses binary frames the same as text
+	message = orjson.dumps({"type": "detection", "payload": payload})
 	try:
-		async with websockets.connect(signaling_url) as ws:
-			message = {"type": "detection", "payload": payload}
-			await ws.send(json.dumps(message))
-			logger.info("Published detection to signaling server")
+		async with app.state.signaling_send_lock:
+			await ws.send(message)
+		logger.debug("Published detection to signaling server")
 	except Exception as e:
 		logger.error("Failed to forward to signaling server: %s", e)
 		raise
@@ -274,150 +739,164 @@ async def publish_detection(payload: DetectionPayload):
 	return {"status": "ok", "recv_ts": data["recv_ts"]}
 
 
+def save_frame(fname: str, raw: bytes):
+	try:
+		os.makedirs(os.path.dirname(fname), exist_ok=True)
+		with open(fname, 'wb') as f:
+			f.write(raw)
+		logger.info('Saved incoming frame to %s (%d bytes)', fname, len(raw))
+	except Exception:
+		logger.exception('Failed to save frame to %s', fname)
+
+
+_UNSAFE_FRAME_ID_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def frame_filename(frame_id) -> str:
+	# frame ids come from clients (X-Frame-Id), so keep only a plain file name inside frames/
+	name = _UNSAFE_FRAME_ID_CHARS.sub('_', os.path.basename(str(frame_id or ''))).lstrip('.')
+	return (name or uuid.uuid4().hex) + '.jpg'
+
+
+async def process_frame(raw: bytes, frame_id) -> ORJSONResponse:
+	"""Shared pipeline behind the frame endpoints: optional save, inference, publish, response."""
+	# Optionally save incoming frames for debugging; disable in production for lower latency.
+	# The write happens on a worker thread and is not awaited, so disk I/O never delays the response.
+	if os.environ.get('SAVE_FRAMES', '0') == '1':
+		fname = os.path.join(os.getcwd(), 'frames', frame_filename(frame_id))
+		asyncio.get_running_loop().run_in_executor(None, save_frame, fname, raw)
+
+	if onnx_session is None and torch_model is None:
+		return ORJSONResponse({'status': 'error', 'message': 'no model loaded'}, status_code=503)
+
+	loop = asyncio.get_running_loop()
+	model_kind = 'onnx' if onnx_session is not None else 'pt'
+	try:
+		if onnx_session is None:
+			# PT inference fallback
+			dets, (orig_w, orig_h, r, dw, dh) = await loop.run_in_executor(_infer_pool, infer_pt_sync, raw)
+		elif _batch_queue is not None:
+			# batched frames get their own tensor since the worker stacks them later
+			img_arr, orig_w, orig_h, r, dw, dh, _ = await loop.run_in_executor(_infer_pool, _preprocess, raw)
+			preds = await submit_for_inference(img_arr)
+			dets = await loop.run_in_executor(_infer_pool, non_max_suppression, preds, conf_threshold, iou_threshold)
+		else:
+			dets, (orig_w, orig_h, r, dw, dh) = await loop.run_in_executor(_infer_pool, infer_onnx_sync, raw)
+	except PreprocessError as e:
+		logger.exception('Failed to preprocess image bytes: %s', e)
+		return ORJSONResponse({'status': 'error', 'message': 'preprocess failed: ' + str(e)}, status_code=500)
+	except Exception as e:
+		logger.exception('%s inference failed: %s', model_kind.upper(), e)
+		return ORJSONResponse({'status': 'error', 'message': model_kind + ' inference failed: ' + str(e)}, status_code=500)
+
+	# Map boxes back to original image space and normalize
+	detections = scale_detections(dets, orig_w, orig_h, r, dw, dh)
+	return await publish_detections(frame_id, detections)
+
+
+async def publish_detections(frame_id, detections: list) -> ORJSONResponse:
+	out_payload = {
+		'frame_id': frame_id,
+		'capture_ts': int(time.time() * 1000),
+		'inference_ts': int(time.time() * 1000),
+		'detections': detections
+	}
+	try:
+		await forward_to_signaling(out_payload)
+	except Exception as e:
+		logger.warning('Could not forward detections to signaling: %s', e)
+
+	return ORJSONResponse({'status': 'ok', 'detections': detections})
+
+
 @app.post('/infer_frame')
 async def infer_frame(payload: FramePayload):
-	# Save incoming frame to disk for debug and optional ONNX/PT inference
+	# Decode a base64 (or data URL) JPEG from JSON and run the shared frame pipeline
 	try:
 		data = payload.dict()
 		b64 = data.get('image_b64')
 		if not b64:
 			raise HTTPException(status_code=400, detail='image_b64 missing')
 
-		# strip data URL prefix
-		if b64.startswith('data:'):
-			b64 = b64.split(',', 1)[1]
-
-		# robust decode
+		# large frames take a while to decode, so keep it off the event loop
 		try:
-			raw = base64.b64decode(b64)
+			raw = await asyncio.get_running_loop().run_in_executor(None, decode_image_b64, b64)
 		except Exception:
-			try:
-				cleaned = b64.replace(' ', '+')
-				raw = base64.b64decode(cleaned)
-			except Exception:
-				logger.warning('Failed to base64-decode incoming image; preview first 120 chars: %s', b64[:120])
-				raise
-
-		# Optionally save incoming frames for debugging; disable in production for lower latency
-		if os.environ.get('SAVE_FRAMES', '0') == '1':
-			outdir = os.path.join(os.getcwd(), 'frames')
-			os.makedirs(outdir, exist_ok=True)
-			fname = os.path.join(outdir, f"{data.get('frame_id')}.jpg")
-			with open(fname, 'wb') as f:
-				f.write(raw)
-			size = os.path.getsize(fname)
-			logger.info('Saved incoming frame to %s (%d bytes)', fname, size)
-
-		# run inference if a model is available (try ONNX then PT fallback)
-		model_path = os.path.join(os.getcwd(), 'models', 'yolov5n.onnx')
-		global onnx_session, model_input_size, conf_threshold, iou_threshold
-		global torch_model, loaded_model_type
-
-		# try to ensure onnx_session exists
-		if onnx_session is None:
-			onnx_session = load_onnx_model(model_path)
-			if onnx_session is not None:
-				loaded_model_type = 'onnx'
-				loaded_model_path = model_path
+			logger.warning('Failed to base64-decode incoming image; preview first 120 chars: %s', b64[:120])
+			raise
 
-		# try PT fallback if ONNX not loaded
-		if onnx_session is None and torch_model is None:
-			pt = find_pt_model()
-			if pt:
-				try:
-					import torch
-					from models.experimental import attempt_load
-					logger.info('Attempting to load PT model from %s', pt)
-					torch_model = attempt_load(pt, map_location='cpu')
-					torch_model.eval()
-					loaded_model_type = 'pt'
-					loaded_model_path = pt
-					logger.info('Loaded PT model for inference')
-				except Exception:
-					logger.exception('Failed to load PT model fallback')
-
-		# No model loaded
-		if onnx_session is None and torch_model is None:
-			logger.info('No model loaded; saved frame only')
-			return JSONResponse({'status': 'ok', 'message': 'frame saved; no model loaded'})
+		return await process_frame(raw, data.get('frame_id'))
+	except Exception as e:
+		logger.exception('Error in infer_frame: %s', e)
+		raise HTTPException(status_code=500, detail=str(e))
 
-		# Preprocess
-		try:
-			img_arr, orig_w, orig_h, r, dw, dh = preprocess_image_bytes(raw, img_size=model_input_size)
-		except Exception as e:
-			logger.exception('Failed to preprocess image bytes: %s', e)
-			return JSONResponse({'status': 'error', 'message': 'preprocess failed: ' + str(e)}, status_code=500)
 
-		dets = []
-		# ONNX inference
-		if onnx_session is not None:
-			try:
-				input_name = onnx_session.get_inputs()[0].name
-				outputs = onnx_session.run(None, {input_name: img_arr})
-				preds = None
-				for out in outputs:
-					if isinstance(out, np.ndarray) and out.ndim == 3:
-						preds = out[0]
-						break
-				if preds is None:
-					preds = outputs[0][0]
-				dets = non_max_suppression(preds, conf_thres=conf_threshold, iou_thres=iou_threshold)
-			except Exception as e:
-				logger.exception('ONNX inference failed: %s', e)
-				return JSONResponse({'status': 'error', 'message': 'onnx inference failed: ' + str(e)}, status_code=500)
-
-		# PT inference fallback
-		elif torch_model is not None:
+@app.post('/infer_frame_raw')
+async def infer_frame_raw(request: Request):
+	# Same as /infer_frame, but the body is the encoded image itself (e.g. Content-Type: image/jpeg)
+	# and the frame id travels in X-Frame-Id: no base64 inflation on the wire and no decode pass
+	try:
+		raw = await request.body()
+		if not raw:
+			return ORJSONResponse({'status': 'error', 'message': 'empty body'}, status_code=400)
+		return await process_frame(raw, request.headers.get('X-Frame-Id', ''))
+	except Exception as e:
+		logger.exception('Error in infer_frame_raw: %s', e)
+		raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post('/infer_tensor')
+async def infer_tensor(request: Request):
+	# For senders that letterbox and normalize frames themselves: the body is the raw NCHW RGB tensor,
+	# so the server skips JPEG decode, resize and normalization entirely. Headers:
+	#   X-Tensor-Dtype   float16 (default) or float32 scaled to 0..1, or uint8 pixels 0..255
+	#   X-Tensor-Shape   optional; must be 1,3,S,S where S is the model input size
+	#   X-Original-Size  optional "W,H" of the frame before letterboxing, used to map boxes back onto it
+	#   X-Frame-Id       as for /infer_frame_raw
+	try:
+		raw = await request.body()
+		headers = request.headers
+		size = model_input_size
+		dtype = TENSOR_DTYPES.get(headers.get('X-Tensor-Dtype', 'float16').lower())
+		if dtype is None:
+			return ORJSONResponse({'status': 'error', 'message': 'X-Tensor-Dtype must be one of ' + ', '.join(TENSOR_DTYPES)}, status_code=400)
+		shape = headers.get('X-Tensor-Shape')
+		if shape is not None and shape.replace(' ', '') != f'1,3,{size},{size}':
+			return ORJSONResponse({'status': 'error', 'message': f'X-Tensor-Shape must be 1,3,{size},{size}'}, status_code=400)
+		if len(raw) != 3 * size * size * np.dtype(dtype).itemsize:
+			return ORJSONResponse({'status': 'error', 'message': f'body must hold a 1x3x{size}x{size} {np.dtype(dtype).name} tensor'}, status_code=400)
+		orig_w = orig_h = size
+		r, dw, dh = 1.0, 0.0, 0.0
+		original = headers.get('X-Original-Size')
+		if original:
 			try:
-				import torch
-				inp = torch.from_numpy(img_arr).to('cpu')
-				with torch.no_grad():
-					y = torch_model(inp)
-				if isinstance(y, (list, tuple)):
-					y0 = y[0]
-				else:
-					y0 = y
-				preds = y0.detach().cpu().numpy()
-				if preds.ndim == 3:
-					preds = preds[0]
-				elif preds.ndim == 2:
-					preds = preds
-				else:
-					preds = preds.reshape(-1, preds.shape[-1])
-				dets = non_max_suppression(preds, conf_thres=conf_threshold, iou_thres=iou_threshold)
-			except Exception as e:
-				logger.exception('PT inference failed: %s', e)
-				return JSONResponse({'status': 'error', 'message': 'pt inference failed: ' + str(e)}, status_code=500)
-
-		# Map boxes back to original image space and normalize
-		detections = []
-		for d in dets:
-			x1, y1, x2, y2, score, cls = d
-			x1 = max(0, (x1 - dw) / r)
-			x2 = max(0, (x2 - dw) / r)
-			y1 = max(0, (y1 - dh) / r)
-			y2 = max(0, (y2 - dh) / r)
-			xmin = x1 / orig_w
-			ymin = y1 / orig_h
-			xmax = x2 / orig_w
-			ymax = y2 / orig_h
-			label = COCO_NAMES[int(cls)] if int(cls) < len(COCO_NAMES) else str(int(cls))
-			detections.append({ 'label': label, 'score': float(score), 'xmin': float(xmin), 'ymin': float(ymin), 'xmax': float(xmax), 'ymax': float(ymax) })
-
-		out_payload = {
-			'frame_id': data.get('frame_id'),
-			'capture_ts': int(time.time() * 1000),
-			'inference_ts': int(time.time() * 1000),
-			'detections': detections
-		}
+				orig_w, orig_h = (int(v) for v in original.split(','))
+				if orig_w <= 0 or orig_h <= 0:
+					raise ValueError(original)
+			except ValueError:
+				return ORJSONResponse({'status': 'error', 'message': 'X-Original-Size must be "W,H"'}, status_code=400)
+			r, _, dw, dh = letterbox_params(orig_w, orig_h, (size, size))
+
+		if onnx_session is None and torch_model is None:
+			return ORJSONResponse({'status': 'error', 'message': 'no model loaded'}, status_code=503)
+
+		loop = asyncio.get_running_loop()
+		model_kind = 'onnx' if onnx_session is not None else 'pt'
 		try:
-			await forward_to_signaling(out_payload)
+			if onnx_session is not None and _batch_queue is not None:
+				img_arr = await loop.run_in_executor(_infer_pool, tensor_from_bytes, raw, dtype)
+				preds = await submit_for_inference(img_arr)
+				dets = await loop.run_in_executor(_infer_pool, non_max_suppression, preds, conf_threshold, iou_threshold)
+			else:
+				dets = await loop.run_in_executor(_infer_pool, infer_tensor_sync, raw, dtype)
 		except Exception as e:
-			logger.warning('Could not forward detections to signaling: %s', e)
+			logger.exception('%s inference failed: %s', model_kind.upper(), e)
+			return ORJSONResponse({'status': 'error', 'message': model_kind + ' inference failed: ' + str(e)}, status_code=500)
 
-		return JSONResponse({'status': 'ok', 'detections': detections})
+		detections = scale_detections(dets, orig_w, orig_h, r, dw, dh)
+		return await publish_detections(headers.get('X-Frame-Id', ''), detections)
 	except Exception as e:
-		logger.exception('Error in infer_frame: %s', e)
+		logger.exception('Error in infer_tensor: %s', e)
 		raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -465,7 +944,7 @@ async def model_status():
 			info['model_name'] = os.path.basename(loaded_model_path)
 	except Exception:
 		pass
-	return JSONResponse(info)
+	return ORJSONResponse(info)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+"""Statically quantize the YOLOv5 ONNX model to INT8 (QDQ format) for faster CPU inference.
+
+Activations are calibrated on a folder of real frames, letterboxed exactly as the server does
+before inference. Frames saved by the server with SAVE_FRAMES=1 (`frames/*.jpg`) work well.
+Only the convolutions are quantized: the Detect head that follows them decodes pixel box coordinates
+(0..640) and 0..1 scores into one tensor, and a single uint8 scale across both would flatten every score.
+After writing the model, a few frames are run through both models and the differences are printed.
+The server prefers `yolov5n.int8.onnx` over the FP32 model when both are present.
+
+Run from the server directory:
+    python quantize_onnx.py --model models/yolov5n.onnx --frames frames --out models/yolov5n.int8.onnx
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+from main import non_max_suppression, preprocess_image_bytes
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    def __init__(self, input_name: str, paths: list, img_size: int):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.img_size = img_size
+
+    def get_next(self):
+        for path in self.paths:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            try:
+                img_arr = preprocess_image_bytes(raw, img_size=self.img_size)[0]
+            except Exception as e:
+                print(f'[quantize] skipping {path}: {e}')
+                continue
+            return {self.input_name: img_arr}
+        return None
+
+
+def check_accuracy(fp32_path: str, int8_path: str, paths: list, img_size: int):
+    # Compare raw predictions and post-NMS detection counts of the two models on the same frames
+    import numpy as np
+    import onnxruntime as ort
+
+    fp32 = ort.InferenceSession(fp32_path, providers=['CPUExecutionProvider'])
+    int8 = ort.InferenceSession(int8_path, providers=['CPUExecutionProvider'])
+    input_name = fp32.get_inputs()[0].name
+    box_err, score_err, counts = [], [], []
+    for path in paths:
+        with open(path, 'rb') as f:
+            img_arr = preprocess_image_bytes(f.read(), img_size=img_size)[0]
+        a = fp32.run(None, {input_name: img_arr})[0][0]
+        b = int8.run(None, {input_name: img_arr})[0][0]
+        box_err.append(np.abs(a[:, :4] - b[:, :4]).mean())
+        score_err.append(np.abs(a[:, 4] - b[:, 4]).max())
+        counts.append((len(non_max_suppression(a)[1]), len(non_max_suppression(b)[1])))
+    print(f'[quantize] check on {len(paths)} frames: mean box error {np.mean(box_err):.2f} px, '
+          f'max objectness error {np.max(score_err):.3f}')
+    print('[quantize] detections fp32/int8 per frame: ' + ' '.join(f'{x}/{y}' for x, y in counts))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=os.path.join('models', 'yolov5n.onnx'))
+    parser.add_argument('--frames', default='frames', help='directory of calibration images (jpg/png)')
+    parser.add_argument('--out', default=None, help='defaults to <model>.int8.onnx')
+    parser.add_argument('--img', type=int, default=640)
+    parser.add_argument('--max-frames', type=int, default=200)
+    parser.add_argument('--check-frames', type=int, default=10, help='frames compared against FP32 afterwards (0 to skip)')
+    args = parser.parse_args()
+
+    out = args.out or os.path.splitext(args.model)[0] + '.int8.onnx'
+    paths = sorted(glob.glob(os.path.join(args.frames, '*.jpg')) + glob.glob(os.path.join(args.frames, '*.png')))
+    paths = paths[:args.max_frames]
+    if not paths:
+        raise SystemExit(f'No calibration images found in {args.frames}')
+
+    import onnx
+    input_name = onnx.load(args.model, load_external_data=False).graph.input[0].name
+    print(f'[quantize] calibrating {args.model} on {len(paths)} frames')
+    quantize_static(
+        args.model,
+        out,
+        FrameCalibrationReader(input_name, paths, args.img),
+        quant_format=QuantFormat.QDQ,
+        # leave the Detect head (Sigmoid/Mul/Add/Pow/Concat/Reshape after the last Convs) in FP32
+        op_types_to_quantize=['Conv'],
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+    )
+    print(f'[quantize] wrote {out}')
+    if args.check_frames > 0:
+        check_accuracy(args.model, out, paths[:args.check_frames], args.img)
+
+
+if __name__ == '__main__':
+    main()
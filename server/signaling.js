@@ -81,56 +81,74 @@ wss.on('connection', (ws, req) => {
         ws.isAlive = true;
     });
 
+    // Validate (for detections) and broadcast a single parsed message to all other peers
+    const handleMessage = (data) => {
+        if (data.type === 'chat') {
+            console.log('Chat payload:', data.payload && data.payload.text ? data.payload.text : '(no text)');
+        }
+        
+        // If this is a detection message, validate payload before broadcasting
+        if (data.type === 'detection') {
+            const payload = data.payload !== undefined ? data.payload : data;
+            const v = validateDetectionPayload(payload);
+            if (!v.ok) {
+                console.warn('Invalid detection payload from', peerId, v.reason);
+                try {
+                    ws.send(JSON.stringify({ type: 'error', code: 'invalid_detection', reason: v.reason }));
+                } catch (e) {
+                    console.error('Failed to send error to peer:', peerId, e);
+                }
+                return; // don't broadcast invalid payloads
+            }
+        }
+        
+        // Broadcast to all other peers. Forward the original payload under `payload` for consistent handling
+        peers.forEach((peer, id) => {
+            if (id !== peerId && peer.readyState === WebSocket.OPEN) {
+                try {
+                    const forwarded = {
+                        type: data.type,
+                        from: peerId,
+                        payload: data.payload !== undefined ? data.payload : data
+                    };
+                    // If this is a detection message, add server recv timestamp to help clients align frames
+                    if (data.type === 'detection' && forwarded.payload && typeof forwarded.payload === 'object') {
+                        try {
+                            // create a shallow copy to avoid mutating the original payload reference
+                            forwarded.payload = Object.assign({}, forwarded.payload, { recv_ts: Date.now() });
+                        } catch (e) {
+                            // ignore if payload is not mutable
+                        }
+                    }
+                    // Log the forwarded payload keys for debugging
+                    console.log('Forwarding', data.type, 'to', id, 'payloadKeys:', forwarded.payload && typeof forwarded.payload === 'object' ? Object.keys(forwarded.payload) : typeof forwarded.payload);
+                    peer.send(JSON.stringify(forwarded));
+                    console.log('Forwarded', data.type, 'message to peer:', id);
+                } catch (e) {
+                    console.error('Failed to send to peer:', id, e);
+                }
+            }
+        });
+    };
+
     ws.on('message', (message) => {
         try {
             const data = JSON.parse(message);
             console.log('Received message:', data.type, 'from:', peerId);
-            if (data.type === 'chat') {
-                console.log('Chat payload:', data.payload && data.payload.text ? data.payload.text : '(no text)');
-            }
-            
-            // If this is a detection message, validate payload before broadcasting
-            if (data.type === 'detection') {
-                const payload = data.payload !== undefined ? data.payload : data;
-                const v = validateDetectionPayload(payload);
-                if (!v.ok) {
-                    console.warn('Invalid detection payload from', peerId, v.reason);
+            // A batch frame coalesces several detection payloads; each is validated and forwarded as its own detection message
+            if (data.type === 'batch') {
+                if (!Array.isArray(data.payload)) {
                     try {
-                        ws.send(JSON.stringify({ type: 'error', code: 'invalid_detection', reason: v.reason }));
+                        ws.send(JSON.stringify({ type: 'error', code: 'invalid_batch', reason: 'batch payload must be an array' }));
                     } catch (e) {
                         console.error('Failed to send error to peer:', peerId, e);
                     }
-                    return; // don't broadcast invalid payloads
+                    return;
                 }
+                data.payload.forEach((payload) => handleMessage({ type: 'detection', payload }));
+                return;
             }
-            
-            // Broadcast to all other peers. Forward the original payload under `payload` for consistent handling
-            peers.forEach((peer, id) => {
-                if (id !== peerId && peer.readyState === WebSocket.OPEN) {
-                    try {
-                        const forwarded = {
-                            type: data.type,
-                            from: peerId,
-                            payload: data.payload !== undefined ? data.payload : data
-                        };
-                        // If this is a detection message, add server recv timestamp to help clients align frames
-                        if (data.type === 'detection' && forwarded.payload && typeof forwarded.payload === 'object') {
-                            try {
-                                // create a shallow copy to avoid mutating the original payload reference
-                                forwarded.payload = Object.assign({}, forwarded.payload, { recv_ts: Date.now() });
-                            } catch (e) {
-                                // ignore if payload is not mutable
-                            }
-                        }
-                        // Log the forwarded payload keys for debugging
-                        console.log('Forwarding', data.type, 'to', id, 'payloadKeys:', forwarded.payload && typeof forwarded.payload === 'object' ? Object.keys(forwarded.payload) : typeof forwarded.payload);
-                        peer.send(JSON.stringify(forwarded));
-                        console.log('Forwarded', data.type, 'message to peer:', id);
-                    } catch (e) {
-                        console.error('Failed to send to peer:', id, e);
-                    }
-                }
-            });
+            handleMessage(data);
         } catch (e) {
             console.error('Failed to handle message:', e);
         }